@@ -15,13 +15,19 @@ import zipfile
 import pickle
 import argparse
 import random
+import functools
+import importlib.util
 import pandas as pd
 
 # Local Python files to import
 import postcodesgeneratedf as pcgen     # To populate a dataframe from source data files
-import postcodesplot as pcplot          # To handle details of plotting postcode-based maps
 import postcodesreport as pcreport   # To handle details of plotting postcode-based maps
-import nationalgrid as ng               # To handle OS National Grid squares
+
+# The plotting modules below pull in the graphics packages (OpenCV, Tk, Bokeh, Plotly, matplotlib) which are slow to load, 
+# so they are only imported by the functions which use them, rather than here, so that the sub-commands which don't plot
+# anything don't pay for loading them. 
+# - postcodesplot as pcplot : to handle details of plotting postcode-based maps
+# - nationalgrid as ng : to handle OS National Grid squares
 
 #############################################################################################
 
@@ -75,6 +81,18 @@ def normalisePostcodeFormat(postcode, verbose=False) :
     # - this results in all valid postcodes having a normalised form which is 7 characters long
     # - this matches the default formatting which is used in the OS postcode data file
 
+    npc = _normalisePostcodeString(postcode)
+
+    if verbose :
+        print(f'Normalised postcode [{postcode}] to [{npc}]')
+
+    return npc
+
+@functools.lru_cache(maxsize=4096)
+def _normalisePostcodeString(postcode) :
+    '''Does the normalisation for normalisePostcodeFormat. Kept free of side effects so that results can be cached
+       for postcodes which are normalised repeatedly.'''
+
     # Convert to upper case, remove trailing spaces and internal spaces ...
     npc = postcode.upper().strip().replace(' ', '')
 
@@ -84,11 +102,23 @@ def normalisePostcodeFormat(postcode, verbose=False) :
         spaces = ' '*(7-len(npc))
         npc = npc[0:-3] + spaces + npc[-3:]
 
-    if verbose :
-        print(f'Normalised postcode [{postcode}] to [{npc}]')
-
     return npc
 
+def normalisePostcodeSeries(serPostcodes) :
+    '''Returns a Series of postcode strings converted into the same normalised format as
+       normalisePostcodeFormat, using whole-column string operations rather than a per-postcode call.'''
+
+    # Same rules as normalisePostcodeFormat above: upper case, no whitespace, then pad the 5 and
+    # 6 character cases out to 7 characters with spaces before the 3-character inward code.
+    npcs = serPostcodes.str.upper().str.strip().str.replace(' ', '', regex=False)
+    lengths = npcs.str.len()
+    outward = npcs.str[:-3]
+    inward = npcs.str[-3:]
+    npcs = npcs.where(lengths != 6, outward + ' ' + inward)
+    npcs = npcs.where(lengths != 5, outward + '  ' + inward)
+
+    return npcs
+
 #############################################################################################
 
 def saveDataframeAsCSV(df, postcodeArea='all', outDir=None, verbose=False) :
@@ -106,9 +136,8 @@ def saveDataframeAsCSV(df, postcodeArea='all', outDir=None, verbose=False) :
     # Generate a name to be used for the CSV file.
     outFile = f'{outDir}/postcodes.{postcodeArea.lower()}.csv'
 
-    if not os.path.isdir(outDir) :
-        print(f'.. creating output directory {outDir} ..')
-        os.makedirs(outDir)
+    # Create the output directory if needed, in a single step rather than checking first whether it exists.
+    os.makedirs(outDir, exist_ok=True)
 
     # Work out which rows in the data from to save in the CSV file.
     if postcodeArea != 'all' :
@@ -144,7 +173,7 @@ def displayPostcodeInfo(df, postcode='NG2 6AG', verbose=False) :
 
     print()
 
-    founddf = df [df['Postcode'] == normalisedPostcode]
+    founddf = findPostcodeRows(df, normalisedPostcode)
     if founddf.empty :
         print(f'*** Postcode not found : {normalisedPostcode}')
         return 1
@@ -169,6 +198,34 @@ def displayPostcodeInfo(df, postcode='NG2 6AG', verbose=False) :
 
     return 0
 
+def displayPostcodesInfo(df, postcodes, verbose=False) :
+    '''Displays data relating to a list of postcodes, one row per postcode, looking them all up in one go. 
+       Returns 0 if all the postcodes are found, 1 if not.'''
+
+    normalisedPostcodes = normalisePostcodeSeries(pd.Series(postcodes, dtype='object'))
+    if verbose :
+        print()
+        for postcode, npc in zip(postcodes, normalisedPostcodes) :
+            print(f'Normalised postcode [{postcode}] to [{npc}]')
+
+    # Postcode is the primary key, so the index gives one position per postcode looked up, -1 if it's not found.
+    positions = getPostcodeIndex(df).get_indexer_for(normalisedPostcodes)
+    found = positions >= 0
+
+    print()
+    if found.any() :
+        # Print horizontally, wrapping on to the next line, so all columns are listed.
+        pd.set_option('display.expand_frame_repr', False)
+        print(df.iloc[positions[found]])
+
+    if not found.all() :
+        print()
+        for npc in normalisedPostcodes[~found] :
+            print(f'*** Postcode not found : {npc}')
+        return 1
+
+    return 0
+
 #############################################################################################
 
 # Functions to handle the initial processing of the 'plot' command, to work out what 'place'
@@ -213,6 +270,8 @@ def extractPlaceInfoFromPlaceArgs(df, placeArg, verbose=False) :
     '''Inspect the 'place' argument from the command line.
        Return a (place type, place value) tuple from it.'''
 
+    import nationalgrid as ng
+
     failureIndicator = ('','')     # Returned when we find an error in the argument.
     placeType, placeValue = ('','')
 
@@ -280,6 +339,8 @@ def plotPlace(df, placeType, placeValue, plotter='CV2', imageOutDir=None, verbos
     '''Dispatches plotting to detailed methods for each place type, after checking that the place is known.
        Returns 0 if successful, 2 if the place is not known.'''
 
+    import nationalgrid as ng
+
     # Special value for the output directory to indicate that the output image file should not be saved.
     if imageOutDir != None and imageOutDir.lower() == 'none' :
         imageOutDir = None
@@ -333,7 +394,25 @@ def checkPostcodeAreaExists(df, code) :
 
 def checkPostcodeExists(df, code) :
     '''Does this Postcode exist in the dataframe ?'''
-    return normalisePostcodeFormat(code) in df['Postcode'].values
+    return not findPostcodeRows(df, normalisePostcodeFormat(code)).empty
+
+# Index on the Postcode column of the most recently searched dataframe, so that repeated lookups
+# (e.g. a check followed by a plot, or a series of random plots) hash into the index rather than
+# comparing against every postcode in the dataframe each time.
+postcodeIndexCache = { 'df' : None, 'index' : None }
+
+def getPostcodeIndex(df) :
+    '''Returns an index on the Postcode column of the dataframe, built on the first lookup against this dataframe.'''
+    if postcodeIndexCache['df'] is not df :
+        postcodeIndexCache['df'] = df
+        postcodeIndexCache['index'] = pd.Index(df['Postcode'])
+    return postcodeIndexCache['index']
+
+def findPostcodeRows(df, normalisedPostcode) :
+    '''Returns the rows of the dataframe with the specified (already normalised) postcode, using an
+       index on the Postcode column.'''
+    positions = getPostcodeIndex(df).get_indexer_for([normalisedPostcode])
+    return df.iloc[positions[positions >= 0]]
 
 def getRandomCodeFromDataframe(df, columnName) :
     '''Return a random value from the specified column of the dataframe.'''
@@ -350,6 +429,9 @@ def getRandomPostcodeArea(df) :
 
 def getRandomGridSquare(df) :
     '''Return a random land-based National Grid square name.'''
+
+    import nationalgrid as ng
+
     l = ng.getNonSeaGridSquareNames()
     randomIndex = random.randrange(0, len(l))
     return l[randomIndex]
@@ -418,14 +500,19 @@ def restrictToGridRectangle(df, bottomLeft, topRight) :
        of coordindates defined by the bottomLeft and topRight eastings/northing points are retained. 
        Returns the filtered dataframe.
     '''
-    dfArea = df
-    dfArea = dfArea [ (dfArea['Eastings']  >= bottomLeft[0]) & (dfArea['Eastings']  <= topRight[0])]
-    dfArea = dfArea [ (dfArea['Northings'] >= bottomLeft[1]) & (dfArea['Northings'] <= topRight[1])]
+    # Build a single mask from the underlying coordinate arrays, so that the dataframe is only sliced once.
+    eastings = df['Eastings'].to_numpy()
+    northings = df['Northings'].to_numpy()
+    inRectangle = (eastings >= bottomLeft[0]) & (eastings <= topRight[0])
+    inRectangle &= (northings >= bottomLeft[1]) & (northings <= topRight[1])
+    dfArea = df [ inRectangle ]
     return dfArea
 
 def plotAllGB(df, plotter='CV2', savefilelocation=None, verbose=False, displayPlot=True) :
     '''Set up a plot of all postcodes in Great Britain.'''
 
+    import postcodesplot as pcplot
+
     if plotter == 'TK' :
         print()
         print(f'*** Plot of all GB using TK plotter not attempted - can be very slow. Try the CV2 plotter.')
@@ -463,6 +550,8 @@ def getPostTown(df) :
 def plotPostcodeArea(df, postcodeArea='TQ', plotter='CV2', savefilelocation=None, verbose=False, displayPlot=True) :
     '''Set up a plot of the postcodes in the specified postcode area.'''
 
+    import postcodesplot as pcplot
+
     # Filter the dataframe to just hold postcodes in this postcode area
     dfArea = df [ df['Postcode_area'] == postcodeArea.upper()]
     if dfArea.empty :
@@ -491,6 +580,9 @@ def plotPostcodeArea(df, postcodeArea='TQ', plotter='CV2', savefilelocation=None
 def plotGridSquare(df, sqName='TQ', plotter='CV2', savefilelocation=None, verbose=False, displayPlot=True) :
     '''Set up a plot of the postcodes in the specified National Grid square.'''
 
+    import nationalgrid as ng
+    import postcodesplot as pcplot
+
     sq = ng.dictGridSquares[sqName.upper()]        
     
     if not sq.isRealSquare :
@@ -545,8 +637,7 @@ def plotGridSquare(df, sqName='TQ', plotter='CV2', savefilelocation=None, verbos
 def getPostcodeLocationDescription(dfpc, verbose=False) :
     '''Extract fields from a dataframe expected to containing a record for a single postcode, and use them to briefly describe its location.'''
 
-    df = dfpc.reset_index()
-    (ward, district, county, country) = df.loc[0, ['Ward Name', 'District Name', 'County Name', 'Country Name'] ]
+    (ward, district, county, country) = dfpc[['Ward Name', 'District Name', 'County Name', 'Country Name']].iloc[0]
 
     if pd.isnull(ward):     ward = ''
     if pd.isnull(district): district = ''
@@ -579,8 +670,10 @@ def getPostcodeLocationDescription(dfpc, verbose=False) :
 def plotPostcode(df, postcode, plotter='CV2', savefilelocation=None, verbose=False, displayPlot=True) :
     '''Set up a plot of the postcodes within a square centred on a specific postcode.'''
 
+    import postcodesplot as pcplot
+
     formattedPostcode = normalisePostcodeFormat(postcode)
-    dfpc = df [df['Postcode'] == formattedPostcode]
+    dfpc = findPostcodeRows(df, formattedPostcode)
     if dfpc.empty :
         print(f'*** Postcode to plot {postcode} not found in dataframe')
         return 1
@@ -589,10 +682,9 @@ def plotPostcode(df, postcode, plotter='CV2', savefilelocation=None, verbose=Fal
         return 1
     locationDesc = getPostcodeLocationDescription(dfpc, verbose)
 
-    # Get the coordindates of this postcode. .item() converts numpy int to normal Python int
-    dfpc = dfpc.reset_index()
-    pcEasting  = dfpc.loc[0, 'Eastings'].item()
-    pcNorthing = dfpc.loc[0, 'Northings'].item()
+    # Get the coordindates of this postcode directly from its single row. .item() converts numpy int to normal Python int
+    pcEasting  = dfpc['Eastings'].iat[0].item()
+    pcNorthing = dfpc['Northings'].iat[0].item()
 
     # Calculate the NationalGrid coordindates of a square centred on our postcode of interest
     sqDimensions = 10 * 1000    # Metres
@@ -647,25 +739,79 @@ defaultImageOutDir = './pngs'               # Location for image files produced.
 # Generating the dataframe from source data files takes a few minutes, so we cache the dataframe
 # generated in a file in the tmp directory, and read it in again next time we run the program if
 # it's not a 'generate' command being processed.
+# The cache is an Arrow IPC (Feather) file, a columnar format which is much quicker to read back than a pickle file.
+# It is written uncompressed, so reading it back doesn't involve decompressing the data each time the program is run.
+# Writing the file needs the pyarrow package - if it's not available the dataframe is pickled instead, to a file with
+# the name used for pickle caches by earlier versions. The format of a cache file is worked out from its leading bytes
+# rather than its name, so that a cache file location given by the user can be in any of the formats, including the
+# older Parquet format.
+
+arrowFileMagic = b'ARROW1'
+parquetFileMagic = b'PAR1'
+
+def isArrowSupported() :
+    '''Is the pyarrow package available, needed to read and write Arrow cache files ?'''
+    return importlib.util.find_spec('pyarrow') != None
 
 def getCacheFilePath(tmpDir=defaultTmpDir) :
     '''Where is the cached dataframe file located ?'''
-    return tmpDir + '/cached/df.cache'
+    if isArrowSupported() :
+        return tmpDir + '/cached/df.arrow'
+    else :
+        return getLegacyCacheFilePaths(tmpDir)[1]
+
+def getLegacyCacheFilePaths(tmpDir=defaultTmpDir) :
+    '''Where were cached dataframe files located by earlier versions, when they were Parquet or pickle files ?'''
+    return [tmpDir + '/cached/df.parquet', tmpDir + '/cached/df.cache']
+
+def upgradeLegacyCacheFile(tmpDir=defaultTmpDir, verbose=False) :
+    '''If there is no cached dataframe file in the default location, but there is one from an earlier version, write
+       the dataframe out again as a current cache file, so that the data doesn't need to be regenerated.
+       Without Arrow support the pickle file is still the current cache file, so there is nothing to upgrade.'''
+    if not isArrowSupported() :
+        return
+
+    cacheFile = getCacheFilePath(tmpDir)
+    if os.path.isfile(cacheFile) :
+        return
+
+    for legacyCacheFile in getLegacyCacheFilePaths(tmpDir) :
+        if os.path.isfile(legacyCacheFile) :
+            print(f'Upgrading older cache file {legacyCacheFile} ..')
+            df = readCachedDataFrame(tmpDir, legacyCacheFile, verbose)
+            writeCachedDataFrame(df, tmpDir, cacheFile, verbose)
+            print()
+            return
 
 def readCachedDataFrame(tmpDir=defaultTmpDir, cacheFile=None, verbose=False) :
-    '''Read the cached dataframe pickle file back into a dataframe, and return the dataframe.
+    '''Read the cached dataframe file back into a dataframe, and return the dataframe.
        The default file location can be overridden by the caller.
        Returns an empty dataframe if the file cannot be found.
     '''
     if cacheFile == None :
+        upgradeLegacyCacheFile(tmpDir, verbose)
         cacheFile = getCacheFilePath(tmpDir)
     if os.path.isfile(cacheFile) :
         startTime = pd.Timestamp.now()
+        print(f'Reading pre-existing dataframe from cache file {cacheFile} .. ', flush=True, end='')
         with open(cacheFile, 'rb') as f:
-            print(f'Reading pre-existing dataframe from cache file {cacheFile} .. ', flush=True, end='')
-            df = pickle.load(f)
-            took = pd.Timestamp.now()-startTime
-            print(f'done, took {int(took.total_seconds() * 1000)} milliseconds.')
+            magic = f.read(len(arrowFileMagic))
+        if magic == arrowFileMagic :
+            df = pd.read_feather(cacheFile)
+        elif magic.startswith(parquetFileMagic) :
+            df = pd.read_parquet(cacheFile)
+            # Categorical columns with non-string categories (e.g. Quality) are read back as plain columns, so convert
+            # them back, picking them out from the pandas metadata saved with the file.
+            import pyarrow.parquet
+            pandasMetadata = pyarrow.parquet.read_schema(cacheFile).pandas_metadata
+            for c in pandasMetadata['columns'] :
+                if c['pandas_type'] == 'categorical' and df[c['name']].dtype != 'category' :
+                    df[c['name']] = df[c['name']].astype('category')
+        else :
+            with open(cacheFile, 'rb') as f:
+                df = pickle.load(f)
+        took = pd.Timestamp.now()-startTime
+        print(f'done, took {int(took.total_seconds() * 1000)} milliseconds.')
     else :
         print(f'*** No cache file {cacheFile} found.')
         df = pd.DataFrame()
@@ -673,23 +819,26 @@ def readCachedDataFrame(tmpDir=defaultTmpDir, cacheFile=None, verbose=False) :
     return df
 
 def writeCachedDataFrame(df, tmpDir=defaultTmpDir, cacheFile=None, verbose=False) :
-    '''Write the dataframe out to a cache as a pickle file.
+    '''Write the dataframe out to a cache as an Arrow IPC file, or as a pickle file if Arrow support is not available.
        The default file location can be overridden by the caller.
     '''
     if cacheFile == None :
         cacheFile = getCacheFilePath(tmpDir)
 
-    # Create the directory paths needed, if any.
+    # Create the directory paths needed, if any, in a single step rather than checking first whether they exist.
     cacheFileDir = os.path.dirname(cacheFile)
     print()
-    if not os.path.isdir(cacheFileDir) :
-        os.makedirs(cacheFileDir)
-        print(f'Created cache file location {cacheFileDir}.')
+    os.makedirs(cacheFileDir, exist_ok=True)
 
-    with open(cacheFile, 'wb') as f:
-        print(f'Writing dataframe to cache file {cacheFile} .. ', flush=True, end='')    
-        pickle.dump(df, f)
-        print(f'done.')
+    print(f'Writing dataframe to cache file {cacheFile} .. ', flush=True, end='')    
+    if isArrowSupported() :
+        # The Arrow file format needs a default range index, which the cache doesn't otherwise need to keep.
+        df.reset_index(drop=True).to_feather(cacheFile, compression='uncompressed')
+    else :
+        print(f'(no Arrow support, pickling) .. ', flush=True, end='')    
+        with open(cacheFile, 'wb') as f:
+            pickle.dump(df, f)
+    print(f'done.')
 
 #############################################################################################
 
@@ -731,6 +880,11 @@ def defineAllowedArguments() :
     subparser.set_defaults(cmd='info')
     addStandardArgumentOptions(subparser)
 
+    subparser = subparsers.add_parser('lookup', help='Display info about several postcodes, one line per postcode')
+    subparser.add_argument('postcodes', nargs='+', help='the postcodes of interest, each in quotes if it contains any spaces')
+    subparser.set_defaults(cmd='lookup')
+    addStandardArgumentOptions(subparser)
+
     subparser = subparsers.add_parser('plot', help='Plot a map around the specified postcode.')
     addPlotterArgumentOption(subparser)
     subparser.add_argument('-o', '--outdir', default=defaultImageOutDir, 
@@ -807,6 +961,8 @@ def processCommand(parsedArgs) :
             status = saveDataframeAsCSV(df, parsedArgs.area, parsedArgs.outdir, verbose)
         elif parsedArgs.cmd == 'info' :
             status = displayPostcodeInfo(df, parsedArgs.postcode, verbose)
+        elif parsedArgs.cmd == 'lookup' :
+            status = displayPostcodesInfo(df, parsedArgs.postcodes, verbose)
         elif parsedArgs.cmd == 'stats' :
             status = pcreport.produceStats(df, verbose)
         elif parsedArgs.cmd == 'plot' :
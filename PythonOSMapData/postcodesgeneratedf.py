@@ -17,11 +17,21 @@ https://geoportal.statistics.gov.uk/datasets/ons-postcode-directory-november-201
 import os
 import sys
 import zipfile
+import concurrent.futures
 
+import numpy as np
 import pandas as pd
 
 # NB Also need to have done a 'pip install xlrd' for pd.read_excel calls to work.
 
+# The PyArrow CSV reader is used for the postcode data files if it's installed, as it is quicker than the Pandas one.
+# Otherwise we fall back to the Pandas reader.
+try :
+    import pyarrow
+    import pyarrow.csv
+except ImportError :
+    pyarrow = None
+
 #############################################################################################
 
 def generateDataFrameFromSourceData(dataDir, tmpDir, verbose=False) :
@@ -49,7 +59,7 @@ def generateDataFrameFromSourceData(dataDir, tmpDir, verbose=False) :
     OSZipFile = dataDir + '/codepo_gb.zip'
     postcodeAreasFile = dataDir + '/postcode_district_area_lists.xls'
     # The codelist file is produced when the zip file is extracted under the temp dir
-    codelistFile = tmpDir + '/Doc/codelist.xlsx'
+    codelistFile = tmpDir + '/' + zipCodelistFile
 
     print(f'- preparing files ..')
     success = prepareFiles(OSZipFile, postcodeAreasFile, codelistFile, tmpDir, verbose)
@@ -64,7 +74,7 @@ def generateDataFrameFromSourceData(dataDir, tmpDir, verbose=False) :
     showTiming()
 
     print(f'- loading raw postcode data files ..')
-    df = loadFilesIntoDataFrame(tmpDir, verbose)
+    df = loadFilesIntoDataFrame(OSZipFile, tmpDir, verbose)
     if df.empty :
         return dfEmpty
     showTiming()
@@ -145,8 +155,27 @@ def prepareFiles(OSZipFile, postcodeAreasFile, codelistFile, tmpDir, verbose=Fal
 
     return True
 
+# Locations within the OS Zip file structure of the items we use:
+# - the directory which holds the detailed CSV data files - these are read directly from the zip file
+# - the Column Headers file which lists the columns present in the CSV files
+# - the code list spreadsheet
+zipCSVDataDir = 'Data/CSV/'
+zipColumnHeadersFile = 'Doc/Code-Point_Open_Column_Headers.csv'
+zipCodelistFile = 'Doc/codelist.xlsx'
+
+# Buffer size used when copying data out of the zip file.
+zipCopyBufferSize = 1024 * 1024
+
+def isWantedZipMember(filename) :
+    '''Is this zip file member one which we need to extract ?'''
+    return filename in [zipColumnHeadersFile, zipCodelistFile]
+
+def isCSVDataZipMember(filename) :
+    '''Is this zip file member one of the postcode CSV data files ?'''
+    return filename.startswith(zipCSVDataDir) and filename.endswith('.csv')
+
 def unpackOSZipFile(OSZipFile, tmpDir, verbose=False) :
-    '''Unzips the OS data file under a temporary directory. Checks basic sub-directories are as expected.
+    '''Unzips the files we need from the OS data file under a temporary directory. Checks basic sub-directories are as expected.
         Returns True/False to indicate success/failure.
     '''
 
@@ -166,14 +195,42 @@ def unpackOSZipFile(OSZipFile, tmpDir, verbose=False) :
 
     print(f'.. extracting zip file {OSZipFile} under {tmpDir} ...')
 
+    # Only extract the members we go on to use - the zip file also contains various other documentation files, and the
+    # CSV data files are read directly from the zip file rather than being extracted first. Each member 
+    # is copied out using a large buffer, to cut down on the number of read/write calls.
     # NB No error code is returned by the zipfile module if there is a problem unzipping, instead
     # an exception is thrown which we allow to propagate. The zip file extract will overwrite
     # an existing files in the same location with the same name.
-    z.extractall(path=tmpDir)
+    wantedMembers = [zinfo.filename for zinfo in z.infolist() if not zinfo.is_dir() and isWantedZipMember(zinfo.filename)]
     z.close()
 
+    extractZipMembers(OSZipFile, wantedMembers, tmpDir)
+
     return True
 
+def extractZipMembers(OSZipFile, memberNames, tmpDir) :
+    '''Opens the zip file and extracts the specified members from it under the temporary directory.'''
+
+    # A single copy buffer is used for all the members, rather than allocating a new chunk of memory for each read.
+    copyBuffer = bytearray(zipCopyBufferSize)
+    with zipfile.ZipFile(OSZipFile, mode='r') as z :
+        for memberName in memberNames :
+            extractZipMember(z, z.getinfo(memberName), tmpDir, copyBuffer)
+
+def extractZipMember(z, zinfo, tmpDir, copyBuffer) :
+    '''Extracts a single member of an open zip file to the same relative location under the temporary directory,
+       copying the data across in large chunks using the buffer provided.'''
+
+    targetFile = os.path.join(tmpDir, zinfo.filename)
+    os.makedirs(os.path.dirname(targetFile), exist_ok=True)
+    copyBufferView = memoryview(copyBuffer)
+    with z.open(zinfo) as src, open(targetFile, 'wb') as dst :
+        while True :
+            numBytes = src.readinto(copyBuffer)
+            if numBytes == 0 :
+                break
+            dst.write(copyBufferView[:numBytes])
+
 #############################################################################################
 
 def loadLookups(postcodeAreasFile, codelistFile, verbose=True) :
@@ -196,18 +253,20 @@ def loadLookups(postcodeAreasFile, codelistFile, verbose=True) :
     if dfCountries.empty :
         status = False
 
-    # County, district and ward codes come from the same spreadsheet
-    dfCounties = loadCountyCodes(codelistFile)
+    # County, district and ward codes come from the same spreadsheet, which we read in one go.
+    codelistSheets = loadCodelistSheets(codelistFile)
+
+    dfCounties = loadCountyCodes(codelistSheets)
     dictLookupdf['Counties'] = dfCounties
     if dfCounties.empty :
         status = False
 
-    dfDistricts = loadDistrictCodes(codelistFile)
+    dfDistricts = loadDistrictCodes(codelistSheets)
     dictLookupdf['Districts'] = dfDistricts
     if dfDistricts.empty :
         status = False
 
-    dfWards = loadWardCodes(codelistFile)
+    dfWards = loadWardCodes(codelistSheets)
     dictLookupdf['Wards'] = dfWards
     if dfWards.empty :
         status = False
@@ -268,11 +327,31 @@ def loadCountryCodes() :
                                 })
     return dfCountries
 
-def loadCountyCodes(codelistFile) :
-    '''Reads the OS Code list spreadsheet and returns a dataframe mapping county codes to county names.'''
+# The OS Code List spreadsheet sheets which we use - one for counties, and several for the different
+# types of district and ward.
+codelistCountySheets = ['CTY']
+codelistDistrictSheets = ['DIS', 'MTD', 'UTA', 'LBO']
+codelistWardSheets = ['UTW', 'UTE', 'DIW', 'LBW', 'MTW']
+
+def loadCodelistSheets(codelistFile) :
+    '''Reads all the sheets we need from the OS Code List spreadsheet in a single call, so that the workbook is only
+       opened and decoded once. Returns a dictionary of dataframes keyed by sheet name. The sheets have no column headings,
+       so the dataframe columns are numbered.'''
 
-    # Read the relevant sheet from the spreadsheet, specifying column names as there are none in the sheet.
-    dfCountyCodes = pd.read_excel(codelistFile, sheet_name='CTY', header=None, names=['County Name', 'County Code'])
+    sheetNames = codelistCountySheets + codelistDistrictSheets + codelistWardSheets
+    return pd.read_excel(codelistFile, sheet_name=sheetNames, header=None)
+
+def getCodelistSheet(codelistSheets, sheetName, columnNames) :
+    '''Returns a copy of a sheet read by loadCodelistSheets, with the specified column names.'''
+    df = codelistSheets[sheetName].copy()
+    df.columns = columnNames
+    return df
+
+def loadCountyCodes(codelistSheets) :
+    '''Uses the OS Code list spreadsheet sheets to return a dataframe mapping county codes to county names.'''
+
+    # Get the relevant sheet from the spreadsheet, specifying column names as there are none in the sheet.
+    dfCountyCodes = getCodelistSheet(codelistSheets, 'CTY', ['County Name', 'County Code'])
     
     print(f'.. found {dfCountyCodes.shape[0]} county codes in the code list spreadsheet')
 
@@ -286,17 +365,18 @@ def loadCountyCodes(codelistFile) :
 
     return dfCountyCodes
 
-def _adjustLBO(s) :
-    '''Helper function invoked by Pandas '.apply()' to adjust the names of London Boroughs.'''
-    if s.endswith('London Boro') :
-        return 'London Borough of ' + s.replace(' London Boro', '').strip()
-    elif 'City of London' in s :
-        return 'City of London'
-    else :
-        return s.strip()
+def adjustLBONames(serNames) :
+    '''Adjusts the names of London Boroughs, e.g. 'Camden London Boro' => 'London Borough of Camden', and the 
+       City of London. Works on the whole column of names at once rather than row by row.'''
+    serNames = serNames.str.strip()
+    isBoro = serNames.str.endswith('London Boro', na=False)
+    isCity = ~isBoro & serNames.str.contains('City of London', regex=False, na=False)
+    serNames = serNames.mask(isBoro, 'London Borough of ' + serNames.str.replace(' London Boro', '', regex=False).str.strip())
+    serNames = serNames.mask(isCity, 'City of London')
+    return serNames
 
-def loadDistrictCodes(codelistFile) :
-    '''Reads the OS Code List spreadsheet and returns a dataframe mapping district codes to district names.'''
+def loadDistrictCodes(codelistSheets) :
+    '''Uses the OS Code List spreadsheet sheets to return a dataframe mapping district codes to district names.'''
 
     # Examination of the post code data files has shown that four types of district code combine to populate the 
     # 'admin_district_code' field of the detailed post code data:
@@ -307,17 +387,15 @@ def loadDistrictCodes(codelistFile) :
     # Each district type has its own sheet in the Code List spreadsheet
 
     dfList = []
-    for districtType in ['DIS', 'MTD', 'UTA', 'LBO'] :
-        df = pd.read_excel(codelistFile, sheet_name=districtType, header=None, names=['District Name', 'District Code'])
+    for districtType in codelistDistrictSheets :
+        df = getCodelistSheet(codelistSheets, districtType, ['District Name', 'District Code'])
         dfList.append(df)
 
         print(f'.. found {df.shape[0]} {districtType} district codes in the Code List spreadsheet')
 
         # Change 'London Boro' to 'London Borough' at the end of the district name, where relevant.
-        # Use apply rather than a bulk-column operation as not all rows need the change, and 
-        # making the conditional within the bulk processing is trickier. 
         if districtType == 'LBO' :
-            df['District Name'] = df['District Name'].str.strip().apply(_adjustLBO)
+            df['District Name'] = adjustLBONames(df['District Name'])
 
     # Join the separate dataframes into one large one.
     dfDistrictCodes = pd.concat(dfList, ignore_index=True)
@@ -330,8 +408,8 @@ def loadDistrictCodes(codelistFile) :
 
     return dfDistrictCodes
 
-def loadWardCodes(codelistFile) :
-    '''Reads the OS Code List spreadsheet and returns a dataframe mapping ward codes to ward names.'''
+def loadWardCodes(codelistSheets) :
+    '''Uses the OS Code List spreadsheet sheets to return a dataframe mapping ward codes to ward names.'''
 
     # Examination of the post code data files has shown that five types of ward code combine to populate the 
     # 'admin_ward_code' field of the detailed post code data:
@@ -343,8 +421,8 @@ def loadWardCodes(codelistFile) :
     # Each ward type has its own sheet in the Code List spreadsheet
 
     dfList = []
-    for wardType in ['UTW', 'UTE', 'DIW', 'LBW', 'MTW'] :
-        df = pd.read_excel(codelistFile, sheet_name=wardType, header=None, names=['Ward Name', 'Ward Code'])
+    for wardType in codelistWardSheets :
+        df = getCodelistSheet(codelistSheets, wardType, ['Ward Name', 'Ward Code'])
         dfList.append(df)
 
         print(f'.. found {df.shape[0]} {wardType} ward codes in the Code List spreadsheet')
@@ -362,9 +440,10 @@ def loadWardCodes(codelistFile) :
 
     # Produce a Series of True/False values per ward code, indexed in the same way as the main wards dataframe
     dfDET = dfWardCodes['Ward Name'].str.strip().str.endswith('(DET)')  
-    if dfDET.sum() > 0 :
-        print(f'   .. deleting records for {dfDET.sum()} ward names ending in "(DET)"')
-        dfWardCodes.drop(dfWardCodes[dfDET].index, inplace=True)
+    detCount = dfDET.sum()
+    if detCount > 0 :
+        print(f'   .. deleting records for {detCount} ward names ending in "(DET)"')
+        dfWardCodes = dfWardCodes.loc[~dfDET].reset_index(drop=True)
         print(f'  .. leaving {dfWardCodes.shape[0]} combined ward codes')
 
     # Check we have a good primary key
@@ -390,6 +469,12 @@ columnHeaderNames2 = [ 'Postcode',
                        'NHS_regional_HA_code', 'NHS_HA_code', 
                        'Admin_county_code', 'Admin_district_code', 'Admin_ward_code']
 
+# Types to use for the columns when reading the CSV data, so the parser doesn't have to infer them. The grid reference values 
+# fit comfortably in 32-bit integers, which halves their memory use compared to the default 64-bit ones, and the quality 
+# indicator values are small integers (at most 90), so fit in a single byte.
+columnTypes = {'Postcode' : 'object', 'Positional_quality_indicator' : 'int8', 'Eastings' : 'int32', 'Northings' : 'int32', 
+               'Country_code' : 'object', 'Admin_county_code' : 'object', 'Admin_district_code' : 'object', 'Admin_ward_code' : 'object'}
+
 # Define which of the above column names from line 2 we want to rename in the final dataframe 
 renamedColumns = {'Positional_quality_indicator' :'Quality'}
 
@@ -400,10 +485,17 @@ outputColumnNames = [ 'Postcode',
                       'Eastings', 'Northings', 'Country_code', 
                       # NB NHS code columns have been discarded.
                       'Admin_county_code', 'Admin_district_code', 'Admin_ward_code']
+
+# The columns read from each individual CSV file - the Postcode_area column is added once the files have been combined.
+fileColumnNames = [ c for c in outputColumnNames if c != 'Postcode_area' ]
+
+# And the original names of these columns, so that only they are parsed from the CSV files. They're in the same order as 
+# in the files, so once renamed they match the list above.
+fileColumnNamesToRead = [ c for c in columnHeaderNames2 if renamedColumns.get(c, c) in fileColumnNames ]
 # -------------------------------------------------------------------------------------------
 
-def loadFilesIntoDataFrame(tmpDir, verbose=False) :
-    '''Combines the individual data CSV files for each postcode area into a single dataframe. Returns the dataframe,
+def loadFilesIntoDataFrame(OSZipFile, tmpDir, verbose=False) :
+    '''Combines the individual data CSV files for each postcode area in the OS zip file into a single dataframe. Returns the dataframe,
        or any empty dataframe if there is an error.'''
 
     dfEmpty = pd.DataFrame()        # Returned if we detected a problem
@@ -411,12 +503,11 @@ def loadFilesIntoDataFrame(tmpDir, verbose=False) :
     # Location within the OS Zip file structure of the two items of interest here:
     # - the directory which holds the detailed CSV data files 
     # - the Column Headers file which lists the columns present in the CSV files
-    CSVDataDir = 'Data/CSV/'
-    columnHeadersFile = 'Doc/Code-Point_Open_Column_Headers.csv'
+    CSVDataDir = zipCSVDataDir
+    columnHeadersFile = zipColumnHeadersFile
 
-    # At this point in processing, the ZIP file has already been unzipped under the tmp directory, so
-    # we can generate the full directory paths for these two items.
-    CSVDataDirPath = tmpDir + '/' + CSVDataDir
+    # At this point in processing, the Column Headers file has already been unzipped under the tmp directory, so
+    # we can generate its full path. The CSV data files are read directly from the zip file.
     columnHeadersFilePath = tmpDir + '/' + columnHeadersFile
 
     # First of all, check the Column Headers file provided exists and specifies the columns we expect.
@@ -430,13 +521,15 @@ def loadFilesIntoDataFrame(tmpDir, verbose=False) :
         print(f'*** Problem with column headers definition file {columnHeadersFilePath}.')
         return dfEmpty
 
-    # Check the CSV data directory exists.
-    if not os.path.isdir(CSVDataDirPath) :
-        print(f'*** No {CSVDataDir} CSV data directory found under: {tmpDir}')
+    # Check the zip file has some CSV data files.
+    with zipfile.ZipFile(OSZipFile, mode='r') as z :
+        CSVMemberNames = sorted(name for name in z.namelist() if isCSVDataZipMember(name))
+    if len(CSVMemberNames) == 0 :
+        print(f'*** No {CSVDataDir} CSV data files found in: {OSZipFile}')
         return dfEmpty
 
     # Now process the individual CSV data files.
-    df = loadCSVDataFiles(CSVDataDirPath, verbose)
+    df = loadCSVDataFiles(OSZipFile, CSVMemberNames, verbose)
     if df.empty :
         return dfEmpty
 
@@ -473,68 +566,100 @@ def checkColumnHeadersFile(columnHeadersFilePath, verbose=False) :
 
 def compareListsOfStrings(l1, l2) :
     '''Utility to check whether two lists of strings contain the same items in the same order, ignoring leading/trailing whitespace.'''
-    for i in range(len(l1)) :
-        if l1[i].strip() != l2[i].strip() : return False
-    return True
+    return [s.strip() for s in l1] == [s.strip() for s in l2]
 
-def loadCSVDataFiles(CSVDataDirPath, verbose=False):
-    '''Read the postcode CSV data files in the specified directory, and return a combined dataframe of their data.
+def loadCSVDataFiles(OSZipFile, CSVMemberNames, verbose=False):
+    '''Read the specified postcode CSV data files from the OS zip file, and return a combined dataframe of their data.
        Returns an empty dataframe if their is a problem.'''
 
     dfEmpty = pd.DataFrame()        # Returned if we detected a problem
 
-    # Make a list of all the CSV files in the directory.
-    matchingFilenames = [entry.name for entry in os.scandir(CSVDataDirPath) if entry.is_file() and entry.name.endswith('.csv')]
+    print(f'.. found {len(CSVMemberNames)} postcode data CSV files to process ...')
 
-    print(f'.. found {len(matchingFilenames)} postcode data CSV files to process ...')
-
-    # Load the data for each CSV file in turn.
+    # Load the data for each CSV file. Most of the work of reading a file is decompressing and parsing it, which both the
+    # PyArrow and Pandas CSV readers do with the GIL released, so we read the files using a pool of threads, one per core.
+    # Threads also hand each file's dataframe straight back here, rather than having to pickle it back from a worker
+    # process. map() returns the results in the same order as the files were submitted.
     # We produce a separate dataframe, converted to the set of desired output column names, for each CSV file, and record these
     # dataframes in a list.
 
     totalPostcodes = 0
     listOfDataframes = []
+    listOfPostcodeAreas = []
+    fileRowCounts = []
 
-    for (fileCount, filename) in enumerate(matchingFilenames, start=1) :
-        fullFilename = CSVDataDirPath + '/' + filename
-        # We expect one CSV file for each postcode area, with the CSV file for area XX called filled called xx.csv (in lower case).
-        postcodeArea = filename.replace('.csv', '').upper()
-
-        # Read the CSV file into a dataframe, using the column header names from the specified list..
-        # .. then rename certain columns as specified in a dictionary
-        # .. the add a column called Postcode
-        # .. and output just the columns we're interested in, in the order we want them.
-        # Note that this results in the row index being a numeric range 0-numrows-1
-        df = pd.read_csv(fullFilename, header=None, names=columnHeaderNames2)   \
-                .rename(columns=renamedColumns) \
-                .assign(Postcode_area=postcodeArea)[outputColumnNames]
-        
-        (numrows, numcols) = df.shape
-        if numcols != len(outputColumnNames) :
+    with concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count()) as executor :
+        results = executor.map(loadCSVDataFile, [OSZipFile] * len(CSVMemberNames), CSVMemberNames)
+
+        for (fileCount, (memberName, df)) in enumerate(zip(CSVMemberNames, results), start=1) :
+            filename = os.path.basename(memberName)
+            postcodeArea = filename.replace('.csv', '').upper()
 
-            print(f'*** Unexpected number of columns ({numcols}) in CSV file {filename}')
-            print(df.head())
-            return dfEmpty
+            (numrows, numcols) = df.shape
+            if numcols != len(fileColumnNames) :
 
-        totalPostcodes += numrows
-        listOfDataframes.append(df)
-        if fileCount % 10 == 0 : print(f'   ..{fileCount:3d} files : {filename:>6.6s} {postcodeArea:>2.2s}: {numrows:5d} postcodes : {totalPostcodes:7d} total ..')
+                print(f'*** Unexpected number of columns ({numcols}) in CSV file {filename}')
+                print(df.head())
+                return dfEmpty
+
+            totalPostcodes += numrows
+            listOfDataframes.append(df)
+            listOfPostcodeAreas.append(postcodeArea)
+            fileRowCounts.append(numrows)
+            if fileCount % 10 == 0 : print(f'   ..{fileCount:3d} files : {filename:>6.6s} {postcodeArea:>2.2s}: {numrows:5d} postcodes : {totalPostcodes:7d} total ..')
 
     # Produce a combined dataframe by concatenating all the individual dataframes. Ignore the existing indexes, and so
-    # regenerate the numeric range index from scratch (0-numrows-1)
-    dfCombined = pd.concat(listOfDataframes, ignore_index=True)
-    print(f'.. found {dfCombined.shape[0]} postcodes in {len(matchingFilenames)} CSV files')
+    # regenerate the numeric range index from scratch (0-numrows-1). The individual dataframes are released as soon as
+    # they have been combined, so that they aren't held in memory alongside the combined dataframe for longer than needed.
+    dfCombined = pd.concat(listOfDataframes, ignore_index=True, copy=False)
+    listOfDataframes.clear()
+    del df
+
+    # Add the postcode area column. The rows from each file are contiguous in the combined dataframe, so we can generate
+    # the whole column in one go as a categorical, repeating each file's area code for the number of rows in the file.
+    areaCodes = np.repeat(np.arange(len(listOfPostcodeAreas)), fileRowCounts)
+    dfCombined.insert(outputColumnNames.index('Postcode_area'), 'Postcode_area', 
+                        pd.Categorical.from_codes(areaCodes, categories=listOfPostcodeAreas))
+    print(f'.. found {dfCombined.shape[0]} postcodes in {len(CSVMemberNames)} CSV files')
 
     return dfCombined
 
+def loadCSVDataFile(OSZipFile, memberName) :
+    '''Read a single postcode CSV data file from the OS zip file into a dataframe with the desired output column names 
+       (apart from the postcode area, which is added later), and return it.'''
+
+    # Read the CSV file into a dataframe, using the column header names from the specified list, parsing just the columns
+    # we're interested in, (which are already in the order we want them), with their types specified up front ..
+    # .. then rename certain columns as specified in a dictionary.
+    # Note that this results in the row index being a numeric range 0-numrows-1
+    # The CSV data is streamed straight from the zip file into the parser, rather than being extracted to disk first. Each call
+    # opens its own handle on the zip file, as this function is run in several threads at once.
+    with zipfile.ZipFile(OSZipFile, mode='r') as z, z.open(memberName) as f :
+        if pyarrow is not None :
+            # NB Treat empty strings as nulls, as the Pandas reader does. Several files are already read at once, one per
+            # worker, so the reader doesn't start its own pool of threads for each file as well.
+            arrowColumnTypes = { c : pyarrow.string() if t == 'object' else pyarrow.from_numpy_dtype(np.dtype(t)) 
+                                    for c, t in columnTypes.items() }
+            table = pyarrow.csv.read_csv(f, 
+                        read_options=pyarrow.csv.ReadOptions(column_names=columnHeaderNames2, use_threads=False),
+                        convert_options=pyarrow.csv.ConvertOptions(include_columns=fileColumnNamesToRead, 
+                                                                   column_types=arrowColumnTypes, strings_can_be_null=True))
+            df = table.to_pandas()
+        else :
+            df = pd.read_csv(f, header=None, names=columnHeaderNames2, usecols=fileColumnNamesToRead, dtype=columnTypes)
+
+    return df.rename(columns=renamedColumns)
+
 #############################################################################################
 
 def checkPrimaryKey(context, df, pkColumn) :
     '''Check whether the primary key column of a dataframe contains any duplicates or nulls. Returns True/False.'''
         
-    if not df[pkColumn].is_unique :
+    # A single hash-based pass flags every repeat of an earlier value.
+    serDuplicated = df[pkColumn].duplicated()
+    if serDuplicated.any() :
         print(f'*** Found duplicate "{pkColumn}" column values in {context}')
-        print(df[pkColumn].value_counts())
+        print(df.loc[serDuplicated, pkColumn].head(10).tolist())
         return False
 
     # Check for any null postcodes. isnull() returns an array of booleans, which should all be False.
@@ -586,33 +711,35 @@ def resolveLookupCodes(df, dfLookup, mainDataFrameCodeJoinColumn,
     indent = ' ' * 5        # For formatting progress messages.
 
     # First, see if there are unreferenced values in the lookup table - not necessarily a problem, just for interest.
-    # Right-outer-join the main table and lookup table to find unused domain values in the lookup data. 
-    dfRightOuterJoin = pd.merge(df, dfLookup, left_on=mainDataFrameCodeJoinColumn, right_on=lookupTableCodeColumn, how='right')
-
-    reportOnUnusedLookups(dfRightOuterJoin, mainDataFrameCodeJoinColumn, lookupTableCodeColumn, lookupTableValueColumn, 
+    reportOnUnusedLookups(df, dfLookup, mainDataFrameCodeJoinColumn, lookupTableCodeColumn, lookupTableValueColumn, 
                           indent, verbose)
 
-    # Now do the main join, the same as above but Left-outer-join instead of Right-. If there are code in the 
-    # main data which don't have a value in the lookup table, these will generate rows where the lookup code
-    # column is null and the main table code column is not null.
-    dfJoin = pd.merge(df, dfLookup, left_on=mainDataFrameCodeJoinColumn, right_on=lookupTableCodeColumn, how='left')
-
-    reportOnReferentialIntegrity(dfJoin, mainDataFrameCodeJoinColumn, lookupTableCodeColumn, indent, verbose)
-    reportOnNullCodes(dfJoin, mainDataFrameCodeJoinColumn, indent) 
+    # Now add the looked-up value column. The lookup table code is a primary key and the lookup tables are small, so 
+    # rather than merging the whole of the main dataframe with the lookup table, which builds a new copy of every column, 
+    # map each code to its value through a dictionary and add the result as a single new column. Codes in the main data
+    # which don't have a value in the lookup table (or are null) are given a null value, as for a left-outer-join.
+    # The codes are mapped as plain objects, so that a categorical code column doesn't pass its category ordering on to
+    # the value column.
+    codeToValueDict = dict(zip(dfLookup[lookupTableCodeColumn], dfLookup[lookupTableValueColumn]))
+    df[lookupTableValueColumn] = df[mainDataFrameCodeJoinColumn].astype(object).map(codeToValueDict)
+
+    # The integrity and null checks only need to classify values in the main code column, so they work directly
+    # on that column using membership tests.
+    reportOnReferentialIntegrity(df, dfLookup, mainDataFrameCodeJoinColumn, lookupTableCodeColumn, indent, verbose)
+    reportOnNullCodes(df, mainDataFrameCodeJoinColumn, indent) 
+    if verbose :
+        reportOnCodeUsage(df, mainDataFrameCodeJoinColumn, lookupTableValueColumn, reportCodeUsage, indent)
 
-    # The Pandas merge operation results in the 'code' column from both dataframes appearing in the merged dataframe. We
-    # drop the 'code' column from the lookup table.
-    dfJoin.drop(columns=[lookupTableCodeColumn], inplace=True)
-
-    return dfJoin
+    return df
 
-def reportOnUnusedLookups(dfRightOuterJoin, mainDataFrameCodeJoinColumn, lookupTableCodeColumn, lookupTableValueColumn, 
+def reportOnUnusedLookups(df, dfLookup, mainDataFrameCodeJoinColumn, lookupTableCodeColumn, lookupTableValueColumn, 
                             indent='', verbose=False) :
     '''Report on codes in the lookup table that are not referenced in the main data table.'''
 
-    # The dataframe passed in has been produced using an outer join so that for each unused code in the lookup table, there will
-    # be a row in the joined dataframe which have null values for the columns generated from the main dataframe.
-    dfUnusedLookups = dfRightOuterJoin[ dfRightOuterJoin[mainDataFrameCodeJoinColumn].isnull() ][[lookupTableCodeColumn, lookupTableValueColumn]]
+    # An unused code is one in the lookup table which doesn't appear amongst the distinct values of the main
+    # table code column.
+    usedCodes = pd.Index(df[mainDataFrameCodeJoinColumn].dropna().unique())
+    dfUnusedLookups = dfLookup.loc[ ~dfLookup[lookupTableCodeColumn].isin(usedCodes), [lookupTableCodeColumn, lookupTableValueColumn]]
     unusedLookupsCount = dfUnusedLookups.shape[0]
     if unusedLookupsCount == 0 :
         print(f'{indent}.. all values in the lookup table are referenced in the {mainDataFrameCodeJoinColumn} column ..')
@@ -621,16 +748,19 @@ def reportOnUnusedLookups(dfRightOuterJoin, mainDataFrameCodeJoinColumn, lookupT
                     f'{"code in the lookup table is" if unusedLookupsCount == 1 else "codes in the lookup table are"} '
                     f'not referenced in the {mainDataFrameCodeJoinColumn} column ..')        
         if verbose :
-            # List out the unused values. NB need to access tuple fields by number, as column names have spaces in.
-            for row in dfUnusedLookups.itertuples(index=False) :
-                print(f'{indent}  - {row[0]} : {row[1]}')
+            # List out the unused values, building up the lines from the column arrays and printing them in one go.
+            print('\n'.join(f'{indent}  - {code} : {value}' for code, value in 
+                                zip(dfUnusedLookups[lookupTableCodeColumn].values, dfUnusedLookups[lookupTableValueColumn].values)))
 
 
-def reportOnReferentialIntegrity(dfJoin, mainDataFrameCodeJoinColumn, lookupTableCodeColumn, indent='', verbose=False) :
+def reportOnReferentialIntegrity(df, dfLookup, mainDataFrameCodeJoinColumn, lookupTableCodeColumn, indent='', verbose=False) :
     '''Report on cases where lookup of a code in a lookup table failed.'''
     
-    dfRIFailed = dfJoin[lookupTableCodeColumn].isnull() & dfJoin[mainDataFrameCodeJoinColumn].notnull()
-    dfLookupNotFound = dfJoin[ dfRIFailed ] [['Postcode', mainDataFrameCodeJoinColumn]]
+    # A lookup fails where the main dataframe has a non-null code which isn't one of the codes in the lookup table.
+    codes = df[mainDataFrameCodeJoinColumn]
+    lookupCodes = pd.Index(dfLookup[lookupTableCodeColumn].unique())
+    dfRIFailed = codes.notnull() & ~codes.isin(lookupCodes)
+    dfLookupNotFound = df.loc[ dfRIFailed, ['Postcode', mainDataFrameCodeJoinColumn]]
 
     # Report on referential integrity issues
     lookupsNotFoundCount = dfLookupNotFound.shape[0]
@@ -641,16 +771,15 @@ def reportOnReferentialIntegrity(dfJoin, mainDataFrameCodeJoinColumn, lookupTabl
 
         # Provide some info on how many codes don't match, broken down by code.
         serNonMatchSummary = dfLookupNotFound[mainDataFrameCodeJoinColumn].value_counts()
-        for code, count in serNonMatchSummary.iteritems() :
-            print(f'{indent}  *** code = {code} : {count} cases')
+        print('\n'.join(f'{indent}  *** code = {code} : {count} cases' for code, count in serNonMatchSummary.items()))
 
-def reportOnNullCodes(dfJoin, mainDataFrameCodeJoinColumn, indent='', verbose=False) :
+def reportOnNullCodes(df, mainDataFrameCodeJoinColumn, indent='', verbose=False) :
     '''Report on nulls in a code column used to drive lookups.'''
 
     # Report on how many codes are null (and so won't have joined to the lookup table). If the data indicates
     # that the postcode location quality is low, then we don't expect location coding to be present. So we have
     # various messages to show depending on the number of nulls and whether they are related to location quality.
-    dfNullValues = dfJoin[ dfJoin[mainDataFrameCodeJoinColumn].isnull() ] [['Postcode', 'Postcode_area', 'Quality']]
+    dfNullValues = df.loc[ df[mainDataFrameCodeJoinColumn].isnull(), ['Postcode', 'Postcode_area', 'Quality']]
     nullValuesCount = dfNullValues.shape[0]
     if nullValuesCount == 0 :
         print(f'{indent}.. all codes in the {mainDataFrameCodeJoinColumn} column are non-null')
@@ -663,8 +792,37 @@ def reportOnNullCodes(dfJoin, mainDataFrameCodeJoinColumn, indent='', verbose=Fa
         if locatedButNullCount > 0 :
             print(f'{indent}++ {locatedButNullCount} other codes in the {mainDataFrameCodeJoinColumn} column are null')
 
+def reportOnCodeUsage(dfJoin, mainDataFrameCodeJoinColumn, lookupTableValueColumn, reportCodeUsage=10, indent='') :
+    '''Report on how many rows use each code value, listing up to a specified number of codes.'''
+
+    serUsage = dfJoin.groupby([mainDataFrameCodeJoinColumn, lookupTableValueColumn], observed=True).size()
+    print(f'{indent}.. {serUsage.shape[0]} different {mainDataFrameCodeJoinColumn} values in use ..')
+    if serUsage.shape[0] > reportCodeUsage :
+        print(f'{indent}.. listing the first {reportCodeUsage} cases ..')
+    print('\n'.join(f'{indent}  {code:10.10} {value:30.30} {count:7} rows' for (code, value), count in serUsage[0:reportCodeUsage].items()))
+    if serUsage.shape[0] > reportCodeUsage :
+        print(f'{indent}.. and {serUsage.shape[0] - reportCodeUsage} more cases ..')
+
 #############################################################################################
 
+# Lookup table mapping each character byte to its postcode pattern equivalent - digits to 9, letters to X, anything else
+# left as it is - e.g. 'NG2 6AG' -> 'XX9 9XX'
+postcodePatternLookup = np.arange(256, dtype='uint8')
+postcodePatternLookup[ord('0'):ord('9')+1] = ord('9')
+postcodePatternLookup[ord('A'):ord('Z')+1] = ord('X')
+
+def getPostcodePatterns(serPostcodes) :
+    '''Returns a series of the patterns of the postcodes in the series. The postcodes are converted to a fixed-width
+       byte string array, so that the pattern characters for all of them can be produced by a single lookup table
+       indexing operation on the underlying bytes, rather than string by string.'''
+
+    postcodeBytes = serPostcodes.str.strip().to_numpy().astype('S')
+    width = postcodeBytes.dtype.itemsize
+    # NB Shorter postcodes are padded with null bytes, which map to themselves and are dropped again by the view.
+    patternBytes = postcodePatternLookup[postcodeBytes.view('uint8')].view(f'S{width}')
+
+    return pd.Series(patternBytes.astype(str), index=serPostcodes.index)
+
 def addPostCodeBreakdown(df, verbose=False) :
     '''Breakdown the postcode values in the dataframe into constituent parts and adds them as new columns to 
        the dataframe. Returns the modified dataframe, or an empty dataframe if there is an unexpected postcode pattern.'''
@@ -675,7 +833,7 @@ def addPostCodeBreakdown(df, verbose=False) :
     # In every case, the 'Inward' part consists of the last three characters (9XX), with the 'Outward' part
     # being the part before this.
     print(f'  .. determining patterns ..')
-    dfBreakdown['Pattern']  = dfBreakdown['Postcode'].str.strip().str.replace(r'[0-9]', '9').str.replace(r'[A-Z]', 'X')
+    dfBreakdown['Pattern']  = getPostcodePatterns(dfBreakdown['Postcode'])
     expectedPatterns = ['X9  9XX',
                         'X99 9XX',
                         'X9X 9XX',
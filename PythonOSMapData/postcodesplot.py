@@ -3,8 +3,8 @@ import os
 import pandas as pd
 import numpy as np
 
-from cv2 import cv2
-from tkinter import Tk, Canvas, mainloop
+import cv2
+from tkinter import Tk, Canvas, PhotoImage, mainloop
 from bokeh.plotting import figure, output_file, show
 import plotly.express as px
 import plotly.graph_objects as go
@@ -22,10 +22,35 @@ def getPlotter(plotter) :
         print(f'*** Unknown plotter type: {plotter} - using CV2')
         return CV2PostcodesPlotter()
 
+def softenRGBColours(coloursRGB) :
+    '''Returns a list of softened versions of the RGB colour tuples, with each component moved half way towards 255.'''
+
+    # Work on all the components at once as an integer array. Halving the distance to 255 with a right shift gives the same
+    # rounded-down result as the float calculation ci + (255-ci) * 0.5, and leaves 255 components unchanged.
+    rgb = np.array(coloursRGB, dtype='uint16').reshape(-1, 3)
+    rgb += (255 - rgb) >> 1
+    softenedColoursRGB = [tuple(c) for c in rgb.tolist()]
+
+    return softenedColoursRGB
+
 class postcodesPlotter() :
     
     pcDefaultColourRGB = (128,128,128)
 
+    # Above this number of areas, don't try to avoid giving overlapping areas the same colour.
+    maxAreasForOverlapColouring = 2000
+
+    # Number of postcodes drawn at a time when drawing postcodes into an image array in bulk.
+    bulkPointsBlockSize = 250000
+
+    # Colours to use for distinguishing areas, softened once here rather than each time areas are assigned to colours.
+    # https://www.tcl.tk/man/tcl8.4/TkCmd/colors.htm
+    # https://stackoverflow.com/questions/309149/generate-distinctly-different-rgb-colors-in-graphs has lots of colours about half way down
+    #availableColours = [ "red", "blue", "green", "yellow", "orange", "purple", "brown", 
+    #                        "pink", "cyan2", "magenta2", "violet", "grey"]
+    availableColoursRGB = softenRGBColours([ (255,0,0), (0,0,255), (0,255,0), (255,255,0), (255,165,0), (160,32,240), (165,42,42), 
+                                             (255,192,203), (0,238,238), (238,0,238), (238,130,238), (190,190,190)])
+
     def areaTypeToColumnName(self, areaType) :
         if areaType.lower() == 'pa' :
             areaTypeColumn = 'Postcode_area'
@@ -55,9 +80,11 @@ class postcodesPlotter() :
                 print(f'Determining Eastings and Northing ranges by {areaTypeColumn}:')
 
         # Determine extent of each Postcode Area
-        # Ignore 0s
-        df = df [ df['Eastings'] != 0 ]
-        dfAreaExtents = df[ [areaTypeColumn, 'Eastings', 'Northings'] ].groupby(areaTypeColumn).agg(
+        # Ignore 0s. (Plot slices from getScaledPlot have already had these removed, so avoid copying the data in that case.)
+        hasLocation = df['Eastings'] != 0
+        if not hasLocation.all() :
+            df = df [ hasLocation ]
+        dfAreaExtents = df[ [areaTypeColumn, 'Eastings', 'Northings'] ].groupby(areaTypeColumn, observed=True, sort=False).agg(
                     Cases = (areaTypeColumn, 'count'),
                     Min_E = ('Eastings', 'min'),
                     Max_E = ('Eastings', 'max'),
@@ -73,55 +100,77 @@ class postcodesPlotter() :
             print()
             print(dfAreaExtents)
 
-        # ???? Algorithm to assign areas to colour groups so that close areas don't use the same colour. 
-        # For now just use lots of colours and rely on chance ! 
-        # https://www.tcl.tk/man/tcl8.4/TkCmd/colors.htm
-        # Doesn't seem to work very well = e.g. YO (York) and TS (Teeside) have same colour, and also WC and SE in London. Also
-        # PE (Peterborough) and MK (Milton Keynes). IG/RM/SS form a triple ! Probably more ..
-        # https://stackoverflow.com/questions/309149/generate-distinctly-different-rgb-colors-in-graphs has lots of colours about half way down
-        #availableColours = [ "red", "blue", "green", "yellow", "orange", "purple", "brown", 
-        #                        "pink", "cyan2", "magenta2", "violet", "grey"]
-        availableColoursRGB = [ (255,0,0), (0,0,255), (0,255,0), (255,255,0), (255,165,0), (160,32,240), (165,42,42), 
-                                (255,192,203), (0,238,238), (238,0,238), (238,130,238), (190,190,190)]
-
-        # Soften the RGB colours
-        ac2 = []
-        for c in availableColoursRGB :
-            n = [0,0,0]
-            for i in (0,1,2) :
-                ci = c[i]
-                if ci < 255 :
-                    ci = int(ci + (255-ci) * 0.5)
-                n[i] = ci
-            ac2.append( (n[0],n[1],n[2]))
+        availableColoursRGB = self.availableColoursRGB
 
         if verbose :
-            print(ac2)
-
-        availableColoursRGB = ac2
+            print(availableColoursRGB)
 
         numGroups = len(availableColoursRGB)
 
-        # Set up a list of lists, one per colour
-        colourGroupsList = []
-        # Candidate for defaultDict ?
-        for i in range(numGroups) :
-            colourGroupsList.append([])
-
-        # Spread the Postcode areas across these lists
-        for index, (row) in enumerate(dfAreaExtents.iterrows()) :
-            colourGroupsList[index % numGroups].append(row[0]) 
+        # Assign colours so that areas whose extents overlap, which includes neighbouring areas, use different colours where
+        # possible. If there are too many areas for comparing every pair of them to be sensible, e.g. when colouring by
+        # postcode, fall back to spreading the areas across the colours round-robin and relying on chance.
+        areas = dfAreaExtents.index.to_numpy()
+        if len(areas) <= self.maxAreasForOverlapColouring :
+            areaColourIndexes = self.colourOverlappingAreas(dfAreaExtents, numGroups)
+        else :
+            areaColourIndexes = np.arange(len(areas)) % numGroups
 
         # Produce a dictionary to map each Postcode Area to its colour, as a tuple and as a hex string
-        dRGB = {}
-        dHexString = {}
-        for i in range(numGroups) :
-            for a in colourGroupsList[i] :
-                dRGB[a] = availableColoursRGB[i]
-                dHexString[a] = self.rgbTupleToHexString(dRGB[a])
+        dRGB = { a : availableColoursRGB[i] for a, i in zip(areas, areaColourIndexes) }
+        dHexString = { a : self.rgbTupleToHexString(rgb) for a, rgb in dRGB.items() }
 
         return dRGB, dHexString
 
+    def colourOverlappingAreas(self, dfAreaExtents, numColours) :
+        '''Assigns a colour index to each area in the extents dataframe, trying to avoid giving the same colour to areas whose
+           Eastings/Northings rectangles overlap. Uses the greedy DSATUR graph colouring approach, picking the next area to
+           colour as the one with the most different colours already used by overlapping areas. If all the colours are
+           already in use by overlapping areas, uses the colour used by fewest of them.
+           Returns an array of colour indexes, in the same order as the areas in the dataframe.'''
+
+        minE = dfAreaExtents['Min_E'].to_numpy()
+        maxE = dfAreaExtents['Max_E'].to_numpy()
+        minN = dfAreaExtents['Min_N'].to_numpy()
+        maxN = dfAreaExtents['Max_N'].to_numpy()
+
+        # overlaps[i,j] is True where the rectangles of areas i and j overlap.
+        overlaps = (minE[:,None] <= maxE) & (maxE[:,None] >= minE) & (minN[:,None] <= maxN) & (maxN[:,None] >= minN)
+        np.fill_diagonal(overlaps, False)
+        numOverlaps = overlaps.sum(axis=1)
+
+        numAreas = dfAreaExtents.shape[0]
+        colourIndexes = np.full(numAreas, -1)
+        # neighbourColourCounts[i,c] is the number of areas overlapping area i which have been given colour c.
+        neighbourColourCounts = np.zeros((numAreas, numColours), dtype='int32')
+        for _ in range(numAreas) :
+            uncoloured = np.flatnonzero(colourIndexes < 0)
+            saturation = (neighbourColourCounts[uncoloured] > 0).sum(axis=1)
+            # Most colours in use by overlapping areas first, then most overlapping areas, then the earliest area.
+            area = uncoloured[np.lexsort((-numOverlaps[uncoloured], -saturation))[0]]
+            # The first unused colour if there is one, otherwise the least used one.
+            colour = np.argmin(neighbourColourCounts[area])
+            colourIndexes[area] = colour
+            neighbourColourCounts[overlaps[area], colour] += 1
+
+        return colourIndexes
+
+    def getAreaColourPalette(self, sAreas, areaColourDict) :
+        '''Returns an array of area codes for the areas in the series, and a uint8 array of RGB colours indexed by these codes.
+           The extra default colour row at the end of the palette is picked up by the -1 code given to missing areas.'''
+
+        # The area columns are normally categoricals, in which case the category codes can be used directly. Unused categories
+        # just get unused palette entries.
+        if isinstance(sAreas.dtype, pd.CategoricalDtype) :
+            areaCodes = sAreas.cat.codes.to_numpy()
+            areas = sAreas.cat.categories
+        else :
+            areaCodes, areas = pd.factorize(sAreas)
+        areaPaletteRGB = np.array([areaColourDict.get(a, self.pcDefaultColourRGB) for a in areas] + [self.pcDefaultColourRGB], 
+                                    dtype='uint8')
+
+        return areaCodes, areaPaletteRGB
+
     def getScaledPlot(self, df, canvasHeight=800, bottomLeft=(0,0), topRight=(700000,1250000), density=100) :
         e0 = bottomLeft[0]
         e1 = topRight[0]
@@ -137,34 +186,39 @@ class postcodesPlotter() :
 
         print(f'.. scale = {scaling_factor} : canvasWidth = {canvasWidth}')
 
-        # Could do bulk e/n scaling first too in bulk ?
         # Keep more Scotland (and perhaps Wales, and perhaps more generally remote areas) to maintain shape of landmass ?
+        dfSlice = df.iloc[::density] if density != 1 else df
         if density != 1 :
-            dfSlice = df.copy().iloc[::density]
             print(f'.. postcodes after density reduction = {dfSlice.shape[0]}')
-        else :
-            dfSlice = df.copy()
-        #print(dfSlice.dtypes)
-
-        dfSlice['e_scaled'] = (dfSlice['Eastings'] - e0) // scaling_factor
-        dfSlice['n_scaled'] = (dfSlice['Northings'] - n0) // scaling_factor
-        #print(dfSlice.dtypes)
-        # Above can produce float type columns for e_scaled and n_scaled, which ends up being used to plot a non-integer rectangle.
-        # Convert to int for now, (= truncation?). Probably better to round/convert to int much later on when calling cv2.rectangle.
-        dfSlice = dfSlice.astype({'e_scaled': 'int32', 'n_scaled': 'int32'})
-        #print(dfSlice.dtypes)
-        #dfSlice.astype(int)
-        #print(dfSlice)
-
-        dfSlice = dfSlice [ dfSlice['Eastings'] > 0 ]
-        dfSlice = dfSlice [ (dfSlice['n_scaled'] >= 0) & (dfSlice['n_scaled'] <= canvasHeight)]
-        dfSlice = dfSlice [ (dfSlice['e_scaled'] >= 0) & (dfSlice['e_scaled'] <= canvasWidth)]
-
-        # Why can't the above be combined into one big combination ?
-        # Also, any way to check n_scale and e_scaled are in a range ?
-        #dfSlice = dfSlice [ dfSlice['Eastings'] > 0 &
-        #                    ((dfSlice['n_scaled'] >= 0) & (dfSlice['n_scaled'] <= canvasHeight)) &
-        #                    ((dfSlice['e_scaled'] >= 0) & (dfSlice['e_scaled'] <= canvasWidth)) ]
+
+        # Do the e/n scaling and the filtering in bulk on the underlying arrays, combining the checks into a single mask,
+        # so that only the rows to be plotted are copied out of the dataframe.
+        # Drop the postcodes with no location (Eastings of 0) first, so that the scaling and bounds checks only work on the
+        # located ones. Keep track of their row positions, so the dataframe itself only needs to be sliced once, at the end.
+        E = dfSlice['Eastings'].to_numpy()
+        rows = np.flatnonzero(E > 0)
+        E = E[rows]
+        N = dfSlice['Northings'].to_numpy()[rows]
+        # Apply the offset and scaling and build up the mask in place, rather than allocating a new temporary array at each
+        # step. The scaling is done as (offset * canvasHeight) // n_extent rather than offset // scaling_factor, so that with
+        # integer grid references it stays in exact integer arithmetic, with no float division or truncation of the results.
+        # (NumPy does integer division by a single scalar divisor using a multiply-and-shift in place of a divide.)
+        # The offset subtraction produces each result array directly in its working type, (int64, or float64 if the corner
+        # coordinates aren't integers), rather than converting the coordinate arrays first and then subtracting.
+        workingType = np.result_type(np.int64, e0, n0)
+        e_scaled = np.subtract(E, e0, dtype=workingType)
+        e_scaled *= canvasHeight
+        np.floor_divide(e_scaled, n_extent, out=e_scaled, casting='unsafe')
+        n_scaled = np.subtract(N, n0, dtype=workingType)
+        n_scaled *= canvasHeight
+        np.floor_divide(n_scaled, n_extent, out=n_scaled, casting='unsafe')
+
+        mask = (n_scaled >= 0)
+        mask &= (n_scaled <= canvasHeight)
+        mask &= (e_scaled >= 0)
+        mask &= (e_scaled <= canvasWidth)
+
+        dfSlice = dfSlice.iloc[rows[mask]].assign(e_scaled=e_scaled[mask].astype('int32'), n_scaled=n_scaled[mask].astype('int32'))
 
         return canvasHeight, canvasWidth, dfSlice
 
@@ -201,58 +255,52 @@ class postcodesPlotter() :
         #egColour = areaColourNameDict['E92000001']
         #print(f'egColour: {egColour}')
 
-        #print(dfSlice.index)
-        #print(dfSlice)
-
         #dfSlice['rgbColour'] = dfSlice[colouringColumn].map(areaColourNameDict)
         #mapTupleLambda = lambda c : areaColourNameDict[c]
         #dfSlice['rgbColour'] = dfSlice[colouringColumn].map(mapTupleLambda)
         dfSlice['hexColour'] = dfSlice[colouringColumn].map(areaColourHexStringDict)
 
-        #print(dfSlice)
-
         self._initialisePlot(dfSlice, fullTitle, canvasHeight, canvasWidth)
         self.dfClickLookup = dfSlice
 
-        foundKey = False
-        esKey = -1
-        nsKey = -1
-        areaKey = ''
+        # Map each postcode to its RGB colour through a small palette with an entry per distinct area, so that the colour
+        # for a postcode is found by indexing with its area code, rather than by a dictionary lookup per postcode.
+        areaCodes, areaPaletteRGB = self.getAreaColourPalette(dfSlice[colouringColumn], areaColourNameDict)
 
         if self._useBulkProcessing() :
-            self._bulkProcess(dfSlice['e_scaled'], dfSlice['n_scaled'], dfSlice['rgbColour'], dfSlice['hexColour'])
-            # NB Need to find key postcode info directly, rather than in loop
-            if keyPostcode != None :
-                dfKey = dfSlice [dfSlice['Postcode'] == keyPostcode ]
-                esKey = int(dfKey.reset_index().loc[0, 'e_scaled'])
-                nsKey = int(dfKey.reset_index().loc[0, 'n_scaled'])
-                areaKey = str(dfKey.reset_index().loc[0, colouringColumn])
-                foundKey = True
+            self._bulkProcess(dfSlice['e_scaled'], dfSlice['n_scaled'], areaPaletteRGB[areaCodes], dfSlice['hexColour'])
         else :
-            for index, r in enumerate(zip(dfSlice['e_scaled'], dfSlice['n_scaled'], dfSlice['Postcode'], dfSlice[colouringColumn])):
-                (es, ns, pc, area) = r
-                if index % (100000) == 0 :
-                    print(index, es, ns, pc)
-                rgbColour = areaColourNameDict.get(area, self.pcDefaultColourRGB)
-                self._drawPostcode(index, es, ns, pc, area, rgbColour)
-
-                if keyPostcode != None and pc == keyPostcode :
-                    # Just store a reference ?
-                    esKey = es
-                    nsKey = ns
-                    areaKey = area
-                    foundKey = True
-
-        # Show a specific postcode more prominently. ????
-        if foundKey :
-            rgbTupleColour = areaColourNameDict.get(areaKey, self.pcDefaultColourRGB)
-            hexStringColour = self.rgbTupleToHexString(rgbTupleColour)
-            self._highlightKeyPostcode(esKey, nsKey, keyPostcode, areaKey, rgbTupleColour, hexStringColour)
+            areaPaletteRGBTuples = [tuple(int(c) for c in rgb) for rgb in areaPaletteRGB]
+            # Work through the postcodes in blocks, reporting progress once per block rather than testing for a progress
+            # point on every postcode.
+            numPostcodes = dfSlice.shape[0]
+            progressInterval = 100000
+            for start in range(0, numPostcodes, progressInterval) :
+                end = min(start + progressInterval, numPostcodes)
+                print(f'.. plotting postcodes {start} to {end-1} of {numPostcodes} ..')
+                for index, r in enumerate(zip(dfSlice['e_scaled'].iloc[start:end], dfSlice['n_scaled'].iloc[start:end], 
+                                              dfSlice['Postcode'].iloc[start:end], dfSlice[colouringColumn].iloc[start:end], 
+                                              areaCodes[start:end]), start) :
+                    (es, ns, pc, area, areaCode) = r
+                    rgbColour = areaPaletteRGBTuples[areaCode]
+                    self._drawPostcode(index, es, ns, pc, area, rgbColour)
+
+        # Show a specific postcode more prominently. Its details are looked up directly for both the bulk and the
+        # point-by-point cases, rather than checking each postcode against it as it is drawn.
+        if keyPostcode != None :
+            dfKey = dfSlice [dfSlice['Postcode'] == keyPostcode ]
+            if dfKey.shape[0] > 0 :
+                esKey = int(dfKey['e_scaled'].iloc[0])
+                nsKey = int(dfKey['n_scaled'].iloc[0])
+                areaKey = dfKey[colouringColumn].iloc[0]
+                rgbTupleColour = areaColourNameDict.get(areaKey, self.pcDefaultColourRGB)
+                hexStringColour = self.rgbTupleToHexString(rgbTupleColour)
+                self._highlightKeyPostcode(esKey, nsKey, keyPostcode, areaKey, rgbTupleColour, hexStringColour)
 
     def _useBulkProcessing(self) :
         return False
 
-    def _bulkProcess(self, sE, sN, sRGBTupleColour, sHexStringColour) :
+    def _bulkProcess(self, sE, sN, rgbColours, sHexStringColour) :
         pass
 
     def _drawPostcode(self, index, es, ns, pc, area, rgbColour) :
@@ -261,6 +309,32 @@ class postcodesPlotter() :
     def _highlightKeyPostcode(self, esKey, nsKey, keyPostcode, areaKey, rgbTupleColour, hexStringColour) :
         pass
 
+    def _drawPointsIntoImageArray(self, img, es, ns, colours) :
+        # Each postcode is drawn as a small 3x3 square of pixels, with (es, canvasHeight-ns) as its top-left corner, (as
+        # cv2.rectangle with pt2 2 pixels further on does), writing all the pixels in one go rather than making a call per
+        # postcode. The offset arrays are laid out postcode by postcode, so where squares overlap the later postcode ends up
+        # with the pixel, as when drawing them one at a time. The postcodes are written in blocks, in order, to limit the size
+        # of the temporary 9-pixels-per-postcode arrays.
+        ys = self.canvasHeight - ns
+        height, width = img.shape[:2]
+        for start in range(0, es.shape[0], self.bulkPointsBlockSize) :
+            end = start + self.bulkPointsBlockSize
+            x = (es[start:end,None] + np.array([0,1,2] * 3)).ravel()
+            y = (ys[start:end,None] + np.repeat([0,1,2], 3)).ravel()
+            inImage = (x < width) & (y < height)
+            img[y[inImage], x[inImage]] = np.repeat(colours[start:end], 9, axis=0)[inImage]
+
+    def _recordPointsInLookupIndex(self, lookupIndex, es, ns) :
+        # Record each postcode's index against a small 3x3 square of points centred on it, not just the central one, so that
+        # clicking near a point finds it. Close postcodes overwrite each other, the later one winning.
+        for start in range(0, es.shape[0], self.bulkPointsBlockSize) :
+            end = start + self.bulkPointsBlockSize
+            index = np.arange(start, min(end, es.shape[0]))
+            x = (es[start:end,None] + np.array([-1,0,1] * 3)).ravel()
+            y = (ns[start:end,None] + np.repeat([-1,0,1], 3)).ravel()
+            inLookup = (x >= 0) & (y >= 0)
+            lookupIndex[y[inLookup], x[inLookup]] = np.repeat(index, 9)[inLookup]
+
     def getImage(self) :
         return None
 
@@ -277,21 +351,23 @@ class TKPostcodesPlotter(postcodesPlotter) :
     def __init__(self) :
         # Avoid is unsubscriptable error bodge for now.
         super().__init__()
-        self.tkObjDict = {}
         self.dfClickLookup = pd.DataFrame()
 
-    # https://stackoverflow.com/questions/20399243/display-message-when-hovering-over-something-with-mouse-cursor-in-python
-
-    def onTKObjectClick(self, event):                  
-        print('Got tk object click', event.x, event.y)
-        #print(event.widget.find_closest(event.x, event.y))
-        objID = event.widget.find_closest(event.x, event.y)[0]
-        #print(type(objID))
-        pc = self.tkObjDict[objID]
-        pcinfo = self.dfClickLookup [self.dfClickLookup['Postcode'] == pc]
+    # The postcodes are drawn into an image array in bulk, which is then shown as a single image item on the Tk canvas,
+    # rather than creating a canvas item per postcode, which is very slow and memory-hungry for large numbers of postcodes.
+    # Clicks are resolved to a postcode using a lookup array of postcode indexes, as for the CV2 plotter.
 
-        print(f'obj={objID} : pc={pc}')
-        print(pcinfo)
+    def onTKCanvasClick(self, event):                  
+        print('Got tk canvas click', event.x, event.y)
+        x = event.x
+        y = event.y
+        if not (0 <= x < self.canvasWidth and 0 <= y < self.canvasHeight) or (self.img[y,x] == 255).all() :
+            print('.. white')
+        else :
+            index = self.imgLookupIndex[self.canvasHeight-y,x]
+            pcinfo = self.dfClickLookup.iloc[index]
+            print(f'index={index}')
+            print(pcinfo)
 
     def _initialisePlot(self, dfSlice, title, canvasHeight, canvasWidth) :
         super()._initialisePlot(dfSlice, title, canvasHeight, canvasWidth)
@@ -299,6 +375,8 @@ class TKPostcodesPlotter(postcodesPlotter) :
         self.w = Canvas(self.master, width=canvasWidth, height=canvasHeight)
         self.master.title(title)
         self.w.pack()
+        self.img = np.full((canvasHeight, canvasWidth, 3), 255, dtype='uint8')
+        self.imgLookupIndex = np.full((canvasHeight+2, canvasWidth+2), 0, dtype='int32')
 
     def displayPlot(self) :
         mainloop()
@@ -306,12 +384,19 @@ class TKPostcodesPlotter(postcodesPlotter) :
     def getImage(self) :
         return None
 
-    def _drawPostcode(self, index, es, ns, pc, area, rgbColour) :
-        colour = self.rgbTupleToHexString(rgbColour)
-        objid = self.w.create_oval(es,self.canvasHeight-ns,es,self.canvasHeight-ns, fill=colour, outline=colour, width=2)
-        self.w.tag_bind(objid, '<ButtonPress-1>', self.onTKObjectClick)    
-        #print(f'Adding objid: {objid}')
-        self.tkObjDict[objid] = pc
+    def _useBulkProcessing(self) :
+        return True
+
+    def _bulkProcess(self, sE, sN, rgbColours, sHexStringColour) :
+        self._drawPointsIntoImageArray(self.img, sE.to_numpy(), sN.to_numpy(), rgbColours)
+        self._recordPointsInLookupIndex(self.imgLookupIndex, sE.to_numpy(), sN.to_numpy())
+
+        # Pass the image to Tk in one go, as binary PPM data. Keep a reference to the PhotoImage, otherwise it gets garbage
+        # collected and disappears from the canvas.
+        ppmHeader = f'P6 {self.canvasWidth} {self.canvasHeight} 255 '.encode()
+        self.photo = PhotoImage(master=self.master, data=ppmHeader + self.img.tobytes(), format='PPM')
+        self.w.create_image(0, 0, anchor='nw', image=self.photo)
+        self.w.bind('<ButtonPress-1>', self.onTKCanvasClick)
 
     def _highlightKeyPostcode(self, es, ns, pc, area, rgbColour, hexColour) :
         pass
@@ -324,13 +409,14 @@ class TKPostcodesPlotter(postcodesPlotter) :
 
 class CV2PostcodesPlotter(postcodesPlotter) :
 
-    def newImageArray(self, y, x) :
-        """ Create a new image array of dimensions [y,x,RGB], set to all white """
-        return np.full((y,x,3), 255, dtype='uint8')
+    # NB The image array is held in the BGR colour order that CV2 uses, so that it can be displayed and saved as it is, rather
+    # than having to be reversed from RGB first. RGB colours are converted to BGR as they are drawn.
 
-    def convertToBGR(self, imgArray) :
-        """ Converts a 3-D [y,x,RGB] numpy array to [y,x,BGR] format, (for use with CV2) """
-        return imgArray[:,:,::-1]
+    def newImageArray(self, y, x) :
+        """ Create a new image array of dimensions [y,x,BGR], set to all white """
+        img = np.empty((y,x,3), dtype='uint8')
+        img.fill(255)
+        return img
 
     def __init__(self) :
         # Avoid is unsubscriptable error bodge for now.
@@ -344,10 +430,10 @@ class CV2PostcodesPlotter(postcodesPlotter) :
             yy = self.img.shape[0] - y
             print (f'CV2 event: event={event}, x={x}, y={y} == {yy}, flags={flags}, param={param}')
             # y is first dimension of image - need to subtract from height
-            # NB RGB in img array, convertToBGR converts just before CV2 sees it
-            red = self.img[y,x,0]
+            # NB BGR in img array
+            blue = self.img[y,x,0]
             green = self.img[y,x,1]
-            blue = self.img[y,x,2]
+            red = self.img[y,x,2]
             print (f'{red} : {blue} : {green}')
             if red == 255 and green == 255 and blue == 255 :
                 print('.. white')
@@ -365,10 +451,9 @@ class CV2PostcodesPlotter(postcodesPlotter) :
         # but also getting some out of bounds errors before [-1,0,1] adjustment was there - because ????
 
     def displayPlot(self) :
-        # For CV2 we need to reverse the colour ordering of the array to BGR
         if self.title == '' :
             self.title = 'Title'
-        cv2.imshow(self.title, self.convertToBGR(self.img))
+        cv2.imshow(self.title, self.img)
         cv2.moveWindow(self.title, 200, 20)
         cv2.setMouseCallback(self.title, self.CV2ClickEvent)
         cv2.waitKey(0)
@@ -376,29 +461,18 @@ class CV2PostcodesPlotter(postcodesPlotter) :
 
     def getImage(self) :
         return self.img
-        #return self.convertToBGR(self.img)      # Why need to do convert ????
 
-    def _drawPostcode(self, index, es, ns, pc, area, rgbColour) :
-        #circle radius = 0 == single pixel. 
-        #                          x
-        # radius=1 gives a cross: xxx
-        #                          x
-        # cv2.circle(img, center=(es, canvasHeight-ns), radius=0, color=colour, thickness=-1)
-
-        x = 2   # Seems to work well
-        cv2.rectangle(self.img, pt1=(es, self.canvasHeight-ns), pt2=(es+x, self.canvasHeight-ns+x), color=rgbColour, thickness=-1)
-
-        # Record item against a small 3x3 square of points, not just the central one. Why is this necessary,
-        # how does it relate to the radius value ? What about close postcodes overwriting each other ?
-        for i in [-1,0,1] :
-            for j in [-1,0,1] :
-                pass
-                self.imgLookupIndex[ns+i, es+j] = index
+    def _useBulkProcessing(self) :
+        return True
+
+    def _bulkProcess(self, sE, sN, rgbColours, sHexStringColour) :
+        self._drawPointsIntoImageArray(self.img, sE.to_numpy(), sN.to_numpy(), rgbColours[:,::-1])
+        self._recordPointsInLookupIndex(self.imgLookupIndex, sE.to_numpy(), sN.to_numpy())
 
     def _highlightKeyPostcode(self, es, ns, pc, area, rgbTupleColour, hexStringColour) :
         overlay = self.img.copy()
         x = 30
-        cv2.circle(overlay, center=(es, self.canvasHeight-ns), radius=x, color=rgbTupleColour, thickness=-1)
+        cv2.circle(overlay, center=(es, self.canvasHeight-ns), radius=x, color=rgbTupleColour[::-1], thickness=-1)
         alpha = 0.5
         self.img = cv2.addWeighted(overlay, alpha, self.img, 1-alpha, 0)
 
@@ -409,7 +483,7 @@ class CV2PostcodesPlotter(postcodesPlotter) :
             print(f'Creating directory {outDir} ..')
             os.makedirs(outDir)
 
-        if cv2.imwrite(filename, self.convertToBGR(img)) :
+        if cv2.imwrite(filename, img) :
             print(f'Image file saved as: {filename}')
         else :
             print(f'*** Failed to save image file as: {filename}')
@@ -467,7 +541,7 @@ class BokehPostcodesPlotter(postcodesPlotter) :
         colour = self.rgbTupleToHexString(rgbColour)
         self.bkplot.circle(es, ns, line_color=colour, fill_color=colour, size=3)
 
-    def _bulkProcess(self, sE, sN, sRGBTupleColour, sHexStringColour) :
+    def _bulkProcess(self, sE, sN, rgbColours, sHexStringColour) :
         self.bkplot.circle(x=sE, y=sN, line_color=sHexStringColour, fill_color=sHexStringColour, size=3)
 
     def _highlightKeyPostcode(self, es, ns, pc, area, rgbTupleColour, hexStringColour) :
@@ -519,7 +593,7 @@ class PlotlyPostcodesPlotter(postcodesPlotter) :
     def _drawPostcode(self, index, es, ns, pc, area, rgbColour) :
         pass
 
-    def _bulkProcess(self, sE, sN, sRGBTupleColour, sHexStringColour) :
+    def _bulkProcess(self, sE, sN, rgbColours, sHexStringColour) :
         self.fig = px.scatter(self.dfSlice, x=sE, y=sN, color=sHexStringColour)
 
     def _highlightKeyPostcode(self, es, ns, pc, area, rgbTupleColour, hexStringColour) :
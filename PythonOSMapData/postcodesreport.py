@@ -7,6 +7,9 @@ The entry points for external use are:
 
 '''
 
+import io
+import sys
+import contextlib
 import pandas as pd
 
 # In progress.
@@ -16,59 +19,68 @@ import pandas as pd
 def displayBasicDataFrameInfo(df, verbose=False) :
     '''See what some basic pandas info calls show about the dataframe.'''
 
-    print()
-    print('################## type(df) #####################')
-    print()
-    print(type(df)) 
-    print()
-    print('################## df.shape #################')
-    print()
-    print(df.shape) 
-    print()
-    print('################## df.dtypes ##################')
-    print()
-    print(df.dtypes)
-    print()
-    print('################## df.index ##################')
-    print()
-    print(df.index)
-    print()
-    print('################## df.columns ##################')
-    print()
-    print(df.columns)
-    print()
-    print('################## df.info(null_counts=True) ##################')
-    print()
-    print(df.info(null_counts=True))
-    print()
-    print('################## df.memory_usage(Shallow/Deep/Diff) ##################')
-    print()
-    # Present the memory options as a set for ease of analysis.
-    m = pd.concat([df.memory_usage(deep=False), df.memory_usage(deep=True)], axis=1)
-    m = m.rename(columns = { 0: 'Shallow', 1: 'Deep' })
-    m['Diff'] = m['Deep'] - m['Shallow']
-    print(m)
-    print()
-    print('################## df.describe() ##################')
-    print()
-    # Default is to show numeric columns.
-    print(df.describe())
-    print()
-    print('################## df.describe(include=\'category\').T ##################')
-    print()
-    # Show category-type columns, with .T switching the output round so we can see lots of columns.
-    print(df.describe(include='category').T)
-    print()
-    print('################## df.count() ##################')
-    print()
-    print(df.count())
-    print()
-    print('################## print(df) #####################')
-    print()
-    print(df)
-    print()
+    # The output is built up in memory and written out in one go at the end, rather than as lots of separate writes
+    # to stdout. df.info() writes its output itself (returning None), so it is pointed at the same buffer.
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out) :
+        print()
+        print('################## type(df) #####################')
+        print()
+        print(type(df)) 
+        print()
+        print('################## df.shape #################')
+        print()
+        print(df.shape) 
+        print()
+        print('################## df.dtypes ##################')
+        print()
+        print(df.dtypes)
+        print()
+        print('################## df.index ##################')
+        print()
+        print(df.index)
+        print()
+        print('################## df.columns ##################')
+        print()
+        print(df.columns)
+        print()
+        print('################## df.info(show_counts=True) ##################')
+        print()
+        df.info(buf=out, show_counts=True)
+        print()
+        print('################## df.memory_usage(Shallow/Deep/Diff) ##################')
+        print()
+        # Present the memory options as a set for ease of analysis.
+        m = pd.concat([df.memory_usage(deep=False), df.memory_usage(deep=True)], axis=1)
+        m = m.rename(columns = { 0: 'Shallow', 1: 'Deep' })
+        m['Diff'] = m['Deep'] - m['Shallow']
+        print(m)
+        print()
+        print('################## df.count() ##################')
+        print()
+        print(df.count())
+        print()
+        # The describe() calls and the full print of the dataframe have to format the whole dataframe, which is slow for
+        # the full data set, so only do these if verbose.
+        if verbose :
+            print('################## df.describe() ##################')
+            print()
+            # Default is to show numeric columns.
+            print(df.describe())
+            print()
+            print('################## df.describe(include=\'category\').T ##################')
+            print()
+            # Show category-type columns, with .T switching the output round so we can see lots of columns.
+            print(df.describe(include='category').T)
+            print()
+            print('################## print(df) #####################')
+            print()
+            print(df)
+            print()
 
-    print('###################################################')
+        print('###################################################')
+
+    sys.stdout.write(out.getvalue())
 
     return 0
 
@@ -81,30 +93,34 @@ def produceStats(df, verbose=False) :
 
     print(f'############### Grouping by PostcodeArea, all columns ###############')
     print()
-    dfAreaCounts = df.groupby('Postcode_area').count()
+    dfAreaCounts = df.groupby('Postcode_area', observed=True).count()
     print(f'Shape is {dfAreaCounts.shape}')
     print()
     print(dfAreaCounts)
 
     groupByColumns = [ 'Postcode_area', 'Quality', 'Country_code', 'Admin_county_code', 'Admin_district_code', 
-                        'Admin_district_code', 'Admin_ward_code' ]
+                        'Admin_ward_code' ]
+
+    # Number of distinct values in each column, in one go.
+    print()
+    print(f'############### Distinct value counts ###############')
+    print()
+    print(df.agg({c: 'nunique' for c in groupByColumns}))
 
-    # Just show counts of each distinct value, column by column
+    # Just show counts of each distinct value, column by column. value_counts does the counting in a single pass over
+    # the column, without needing an extra 'count' column to be added to a copy of the dataframe.
     for groupByColumn in groupByColumns :
-        # Need a specific column to count, otherwise just get list of group-by-column values with no counts.
         print()
         print(f'############### Grouping by {groupByColumn}, count only ###############')
         print()
-        dfDistinctColumnValueCounts = df.assign(count=1)[[groupByColumn, 'count']].groupby(groupByColumn).count()
-        print(f'Shape is {dfDistinctColumnValueCounts.shape}')
+        serDistinctColumnValueCounts = df[groupByColumn].value_counts(dropna=False).sort_index()
+        print(f'Shape is {serDistinctColumnValueCounts.shape}')
         print()
-        print(dfDistinctColumnValueCounts)
-        print(dfDistinctColumnValueCounts[0])
-        print(dfDistinctColumnValueCounts[1])
-        
+        print(serDistinctColumnValueCounts)
+
 
     # Just PostcodeArea = shows that just a list of distinct values is returned when grouping a column with itself.
-    dfAreaCounts = df[['Postcode_area']].groupby('Postcode_area').count()
+    dfAreaCounts = df[['Postcode_area']].groupby('Postcode_area', observed=True).count()
     print()
     print(f'############### Grouping by PostcodeArea with itself ###############')
     print()
@@ -140,13 +156,13 @@ def examineLocationColumns(df, verbose=False) :
     if not verbose :
         return
 
-    dfG = df[ ['Postcode', 'Postcode_area', 'Quality', 'Eastings', 'Northings', 'County Name', 'District Name', 'Ward Name'] ].groupby('Quality').count()
+    dfG = df[ ['Postcode', 'Postcode_area', 'Quality', 'Eastings', 'Northings', 'County Name', 'District Name', 'Ward Name'] ].groupby('Quality', observed=True).count()
     print()
     print('Counts of non-null values by location quality:')
     print()
     print(dfG)
 
-    dfG = df[ ['Postcode', 'Postcode_area', 'Quality', 'Eastings', 'Northings'] ].groupby('Quality').agg(
+    dfG = df[ ['Postcode', 'Postcode_area', 'Quality', 'Eastings', 'Northings'] ].groupby('Quality', observed=True).agg(
                 Cases = ('Quality', 'count'),
                 Min_E = ('Eastings', 'min'),
                 Max_E = ('Eastings', 'max'),
@@ -173,41 +189,17 @@ def examinePostcodePatterns(df, verbose=True) :
     if verbose :
         print()
         print(f'.. Postcodes grouped by pattern ..')
-        dfG = df[['Postcode', 'Pattern']].groupby(['Pattern'], as_index=True).count()
+        dfG = df.groupby(['Pattern'], as_index=True, observed=True).size()
         print()
         print(dfG)
         with pd.option_context('display.max_rows', 20000):
             print()
             print(f'.. Postcodes grouped by Area and Outward ..')
-            dfG = df[['Postcode', 'Postcode_area', 'Post Town', 'Outward']].groupby(['Postcode_area', 'Post Town', 'Outward'], as_index=True).count()
+            dfG = df.groupby(['Postcode_area', 'Post Town', 'Outward'], as_index=True, observed=True).size()
             print()
             print(dfG)
             print()
             print(f'.. Unique Districts per Area ..')
-            dfG = df[['Postcode', 'Postcode_area', 'Post Town', 'Outward']].groupby(['Postcode_area', 'Post Town'], as_index=True)['Outward'].nunique()
+            dfG = df.groupby(['Postcode_area', 'Post Town'], as_index=True, observed=True)['Outward'].nunique()
             print()
             print(dfG)
-
-
-
-r"""
-
-Reporting codes usage
-
-    verbose = True
-    if verbose :
-        if reportCodeUsage > 0 :
-            reportingColumns = ['Postcode', mainDataFrameCodeJoinColumn, lookupTableValueColumn]
-            dfReportGroup = dfJoin[reportingColumns].groupby([mainDataFrameCodeJoinColumn, lookupTableValueColumn], as_index=False).count()
-            print()
-            print(f'{dfReportGroup.shape[0]} different {mainDataFrameCodeJoinColumn} values in use:')
-            if dfReportGroup.shape[0] > reportCodeUsage :
-                print(f'{indent}.. listing the first {reportCodeUsage} cases.')
-            print()
-            for index, row in dfReportGroup[0:reportCodeUsage].iterrows() :
-                print(f'{indent}  {row.values[0]:10.10} {row.values[1]:30.30} {row.values[2]:7} rows')
-            if dfReportGroup.shape[0] > reportCodeUsage :
-                print(f'{indent}.. and {dfReportGroup.shape[0] - reportCodeUsage} more cases ..')
-
-
-"""